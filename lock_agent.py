@@ -1,9 +1,9 @@
 """
 Remote Lock Agent — Runs on your Windows Laptop
-Polls the Koyeb server every 2 seconds and activates a fullscreen lock when commanded.
+Listens to the Koyeb server's event stream and activates a fullscreen lock when commanded.
 
 Requirements:
-    pip install requests pillow
+    pip install requests orjson pillow
 
 Usage:
     python lock_agent.py --server https://your-app.koyeb.app --secret your-secret
@@ -14,18 +14,59 @@ Or set env vars:
 """
 
 import sys, os, time, threading, argparse, ctypes, requests
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import tkinter as tk
 from tkinter import font as tkfont
+from PIL import Image, ImageColor, ImageDraw, ImageFont, ImageTk
 
 # ── Config ─────────────────────────────────────────────────────────────────
 DEFAULT_SERVER = os.environ.get("LOCK_SERVER", "https://gradual-ophelie-seeutech-bc4204e6.koyeb.app")
 DEFAULT_SECRET = os.environ.get("LOCK_SECRET", "hellomaya")
-POLL_INTERVAL  = 2   # seconds between server polls
+RETRY_INTERVAL     = 2    # initial seconds between reconnect attempts
+HEARTBEAT_INTERVAL = 30   # server sends a keepalive at least this often
+STREAM_RETRY_INTERVAL = 60   # seconds of /api/status polling before retrying a full stream
+
+# ── Windows API ────────────────────────────────────────────────────────────
+# Resolved once at import with explicit prototypes, rather than going through
+# ctypes.windll's lazy attribute lookup on every lock/unlock.
+SW_HIDE, SW_SHOW = 0, 5
+
+if sys.platform == "win32":
+    from ctypes import wintypes
+    _user32 = ctypes.WinDLL("user32", use_last_error=True)
+    _FindWindowW = _user32.FindWindowW
+    _FindWindowW.argtypes = [wintypes.LPCWSTR, wintypes.LPCWSTR]
+    _FindWindowW.restype = wintypes.HWND
+    _ShowWindow = _user32.ShowWindow
+    _ShowWindow.argtypes = [wintypes.HWND, ctypes.c_int]
+    _ShowWindow.restype = wintypes.BOOL
+else:
+    _FindWindowW = _ShowWindow = None
+
+# ── Drawing helpers ────────────────────────────────────────────────────────
+def _load_font(names: tuple[str, ...], size: float) -> ImageFont.ImageFont:
+    """First TrueType font from *names* that loads, else Pillow's default."""
+    for name in names:
+        try:
+            return ImageFont.truetype(name, round(size))
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(round(size))
+    except TypeError:                      # Pillow < 10.1 takes no size
+        return ImageFont.load_default()
+
+def _blend(bg: str, fg: str, t: float) -> tuple[int, int, int]:
+    """Mix two #rrggbb colours; t=0 gives bg, t=1 gives fg."""
+    b, f = ImageColor.getrgb(bg), ImageColor.getrgb(fg)
+    return tuple(round(b[i] + (f[i] - b[i]) * t) for i in range(3))
 
 # ── Lock Window ────────────────────────────────────────────────────────────
 class LockScreen:
-    def __init__(self, message: str):
-        self.root = tk.Tk()
+    def __init__(self, master: tk.Tk, message: str):
+        self.root = tk.Toplevel(master)
         self._configure_window()
         self._build_ui(message)
         self._block_taskbar()
@@ -56,88 +97,96 @@ class LockScreen:
         r = self.root
         sw = r.winfo_screenwidth()
         sh = r.winfo_screenheight()
+        cy = sh // 2 - 80
 
-        # Dark gradient canvas background
         canvas = tk.Canvas(r, bg="#0a0a0f", highlightthickness=0,
                            width=sw, height=sh)
         canvas.place(x=0, y=0)
 
-        # Animated scanlines illusion via repeated rectangles
-        for y in range(0, sh, 4):
-            canvas.create_line(0, y, sw, y, fill="#111118", width=1)
+        # Static backdrop is rasterized once into a single image item;
+        # keep a reference on self so Tk's PhotoImage isn't garbage-collected
+        self._bg_photo = ImageTk.PhotoImage(self._render_background(sw, sh), master=r)
+        canvas.create_image(0, 0, image=self._bg_photo, anchor="nw")
+
+        # Message block (stays a text item so Tk handles the word wrap)
+        msg_font = tkfont.Font(root=r, family="Segoe UI", size=14)
+        canvas.create_text(sw // 2, cy + 210,
+                            text=message,
+                            fill="#aaaaaa", font=msg_font,
+                            anchor="center", justify="center",
+                            width=600)
+
+        # Blinking cursor effect in bottom right
+        self._blink_cursor(canvas, sw - 30, sh - 30)
+
+    def _render_background(self, sw: int, sh: int) -> Image.Image:
+        """Draw scanlines, glow rings, icon, headline, divider and footer."""
+        pt = self.root.winfo_fpixels("1p")   # Tk font sizes are in points
 
-        # Red pulsing circle accent (static version)
+        # Scanlines: build one pixel column (every 4th row lit) in a single
+        # bytes expression, then stretch it to full width in C
+        bg, line = bytes(ImageColor.getrgb("#0a0a0f")), bytes(ImageColor.getrgb("#111118"))
+        column = ((line + bg * 3) * (sh // 4 + 1))[:sh * 3]
+        img = Image.frombytes("RGB", (1, sh), column).resize((sw, sh), Image.NEAREST)
+        d = ImageDraw.Draw(img)
+
+        # Red glow rings, fading towards the centre
         cx, cy = sw // 2, sh // 2 - 80
         for r_ in range(120, 0, -10):
-            alpha_hex = hex(int(15 * (r_ / 120)))[2:]
-            canvas.create_oval(cx - r_, cy - r_, cx + r_, cy + r_,
-                                outline=f"#ff{alpha_hex}0000" if len(alpha_hex)==1
-                                        else f"#ff{alpha_hex}00",
-                                width=1)
+            d.ellipse((cx - r_, cy - r_, cx + r_, cy + r_),
+                      outline=_blend("#0a0a0f", "#cc2200", 0.35 * r_ / 120), width=1)
 
         # Warning icon (⚠)
-        warn_font = tkfont.Font(family="Segoe UI Symbol", size=64)
-        canvas.create_text(cx, cy, text="⚠", fill="#cc2200",
-                            font=warn_font, anchor="center")
+        d.text((cx, cy), "⚠", fill="#cc2200", anchor="mm",
+               font=_load_font(("seguisym.ttf", "DejaVuSans.ttf"), 64 * pt))
 
         # Headline
-        headline_font = tkfont.Font(family="Segoe UI", size=28, weight="bold")
-        canvas.create_text(sw // 2, cy + 110,
-                            text="SYSTEM ACCESS RESTRICTED",
-                            fill="#ff3322", font=headline_font, anchor="center")
+        d.text((sw // 2, cy + 110), "SYSTEM ACCESS RESTRICTED", fill="#ff3322", anchor="mm",
+               font=_load_font(("segoeuib.ttf", "DejaVuSans-Bold.ttf"), 28 * pt))
 
         # Divider line
-        canvas.create_line(sw//2 - 300, cy + 145,
-                           sw//2 + 300, cy + 145,
-                           fill="#331111", width=2)
-
-        # Message block
-        msg_font = tkfont.Font(family="Segoe UI", size=14)
-        canvas.create_text(sw // 2, cy + 210,
-                            text=message,
-                            fill="#aaaaaa", font=msg_font,
-                            anchor="center", justify="center",
-                            width=600)
+        d.line((sw//2 - 300, cy + 145, sw//2 + 300, cy + 145), fill="#331111", width=2)
 
         # Admin contact footer
-        footer_font = tkfont.Font(family="Courier New", size=10)
-        canvas.create_text(sw // 2, sh - 60,
-                            text="[SYS-LOCK v1.0]  •  Contact your administrator to restore access",
-                            fill="#333344", font=footer_font, anchor="center")
-
-        # Blinking cursor effect in bottom right
-        self._blink_cursor(canvas, sw - 30, sh - 30)
+        d.text((sw // 2, sh - 60),
+               "[SYS-LOCK v1.0]  •  Contact your administrator to restore access",
+               fill="#333344", anchor="mm",
+               font=_load_font(("cour.ttf", "DejaVuSansMono.ttf"), 10 * pt))
+        return img
 
     def _blink_cursor(self, canvas, x, y):
         """Blinking terminal cursor for atmosphere."""
         cursor_id = canvas.create_text(x, y, text="█", fill="#cc2200",
                                        font=("Courier New", 12))
         def toggle(visible=[True]):
-            canvas.itemconfig(cursor_id, fill="#cc2200" if visible[0] else "#0a0a0f")
+            canvas.itemconfigure(cursor_id, state="normal" if visible[0] else "hidden")
             visible[0] = not visible[0]
-            canvas.after(600, toggle)
+            self._cursor_after_id = canvas.after(500, queue)
+        def queue():
+            # Toggle only once Tk is idle so blinks coalesce while it is busy
+            self._cursor_after_id = canvas.after_idle(toggle)
         toggle()
 
     def _block_taskbar(self):
         """Hide taskbar via Windows API."""
-        try:
-            SW_HIDE = 0
-            taskbar = ctypes.windll.user32.FindWindowW("Shell_TrayWnd", None)
-            ctypes.windll.user32.ShowWindow(taskbar, SW_HIDE)
+        self._taskbar_handle = None
+        if _FindWindowW is None:
+            return
+        taskbar = _FindWindowW("Shell_TrayWnd", None)
+        if taskbar:
+            _ShowWindow(taskbar, SW_HIDE)
             self._taskbar_handle = taskbar
-        except Exception:
-            pass
+        else:
+            print(f"[taskbar] FindWindowW failed (error {ctypes.get_last_error()})")
 
     def _restore_taskbar(self):
-        try:
-            SW_SHOW = 5
-            ctypes.windll.user32.ShowWindow(self._taskbar_handle, SW_SHOW)
-        except Exception:
-            pass
+        if self._taskbar_handle:
+            _ShowWindow(self._taskbar_handle, SW_SHOW)
 
     def destroy(self):
         self._restore_taskbar()
         try:
+            self.root.after_cancel(self._cursor_after_id)
             self.root.grab_release()
             self.root.destroy()
         except Exception:
@@ -152,36 +201,59 @@ class LockAgent:
     def __init__(self, server: str, secret: str):
         self.server  = server.rstrip("/")
         self.headers = {"X-Lock-Secret": secret}
+        # One keep-alive connection, reused across stream reconnects
+        self._session = requests.Session()
+        self._session.headers.update(self.headers)
+        # A 503 from /api/events must reach poll() (which falls back to
+        # polling), not be slept through on the server's Retry-After
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1,
+                              max_retries=Retry(total=3, backoff_factor=0.3,
+                                                respect_retry_after_header=False))
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
         self.lock_win: LockScreen | None = None
-        self._lock_thread: threading.Thread | None = None
-        self._running = True
+        self._root: tk.Tk | None = None   # hidden Tk root owned by the run() thread
+        self._stop_event = threading.Event()
+        self._last_event_id: str | None = None   # status ETag of the last event applied
+        self._was_locked = False
 
     def poll(self):
-        """Background thread: polls server and manages lock state."""
-        was_locked = False
-        retry_delay = POLL_INTERVAL
+        """Background thread: follows the server's event stream and manages lock state."""
+        retry_delay = RETRY_INTERVAL
 
-        while self._running:
+        while not self._stop_event.is_set():
             try:
-                r = requests.get(
-                    f"{self.server}/api/status",
-                    headers=self.headers,
-                    timeout=8,
-                    # Force close connection after each request to avoid reset errors
-                    headers={**self.headers, "Connection": "close"}
-                )
-                r.raise_for_status()
-                data = r.json()
-                is_locked = data.get("locked", False)
-                message   = data.get("message", "System restricted.")
-
-                if is_locked and not was_locked:
-                    self._show_lock(message)
-                elif not is_locked and was_locked:
-                    self._hide_lock()
-
-                was_locked = is_locked
-                retry_delay = POLL_INTERVAL   # reset backoff on success
+                # Resuming with the last event id lets the server skip the
+                # snapshot when nothing changed while we were disconnected
+                resume = {"Last-Event-ID": self._last_event_id} if self._last_event_id else {}
+                with self._session.get(
+                    f"{self.server}/api/events",
+                    headers=resume,
+                    stream=True,
+                    # Read timeout well past the heartbeat so a dead socket is noticed
+                    timeout=(8, HEARTBEAT_INTERVAL * 2),
+                ) as r:
+                    if r.status_code == 503:
+                        # All event-stream slots are taken: keep tracking the
+                        # state by conditional polling, then try the stream again
+                        print(f"[busy] Event stream full — polling for {STREAM_RETRY_INTERVAL}s")
+                        self._poll_status(STREAM_RETRY_INTERVAL)
+                        retry_delay = RETRY_INTERVAL
+                        continue
+                    r.raise_for_status()
+                    retry_delay = RETRY_INTERVAL   # reset backoff on success
+                    event_id = None
+
+                    for line in r.iter_lines():
+                        if self._stop_event.is_set():
+                            break
+                        if line.startswith(b"id:"):
+                            event_id = line[3:].strip().decode()
+                            continue
+                        if not line.startswith(b"data:"):
+                            continue               # keepalive comment / blank separator
+                        self._apply_state(orjson.loads(line[5:]))
+                        self._last_event_id = event_id
 
             except requests.exceptions.ConnectionError as e:
                 print(f"[connection error] Server unreachable — retrying in {retry_delay}s")
@@ -191,58 +263,85 @@ class LockAgent:
                 print(f"[timeout] Server did not respond — retrying in {retry_delay}s")
                 retry_delay = min(retry_delay * 2, 30)
 
+            except requests.exceptions.HTTPError as e:
+                print(f"[http error] {e} — retrying in {retry_delay}s")
+                retry_delay = min(retry_delay * 2, 30)
+
             except Exception as e:
                 print(f"[poll error] {e}")
 
-            time.sleep(retry_delay)
+            self._stop_event.wait(retry_delay)
 
-    def _show_lock(self, message: str):
-        """Must be called from the main thread via after()."""
-        def _do():
-            if self.lock_win is None:
-                self.lock_win = LockScreen(message)
-                # Non-blocking mainloop via update loop
-                self._pump_tk()
-        # Schedule on tkinter main loop if running, else call directly
-        if self.lock_win:
-            return
-        _do()
+    def _poll_status(self, duration: float):
+        """Fallback: conditional GET /api/status every RETRY_INTERVAL for *duration* seconds.
 
-    def _pump_tk(self):
-        """Keep tkinter alive while polling runs in background."""
-        if self.lock_win:
-            try:
-                self.lock_win.root.update()
-            except tk.TclError:
-                self.lock_win = None
+        Unchanged state comes back as an empty 304, so only real changes are parsed.
+        """
+        etag = None
+        deadline = time.monotonic() + duration
+        while time.monotonic() < deadline:
+            r = self._session.get(f"{self.server}/api/status",
+                                  headers={"If-None-Match": etag} if etag else {},
+                                  timeout=8)
+            if r.status_code != 304:
+                r.raise_for_status()
+                etag = r.headers.get("ETag")
+                self._apply_state(orjson.loads(r.content))
+                self._last_event_id = None   # stream resumes with a fresh snapshot
+            if self._stop_event.wait(RETRY_INTERVAL):
                 return
-        if self.lock_win:
-            threading.Timer(0.05, self._pump_tk).start()
+
+    def _apply_state(self, data: dict):
+        is_locked = data.get("locked", False)
+        message   = data.get("message", "System restricted.")
+
+        # Tk is not thread-safe: hand UI work to the Tk thread
+        if is_locked and not self._was_locked:
+            self._root.after(0, self._show_lock, message)
+        elif not is_locked and self._was_locked:
+            self._root.after(0, self._hide_lock)
+
+        self._was_locked = is_locked
+
+    def _show_lock(self, message: str):
+        """Runs on the Tk thread, scheduled by poll() via after()."""
+        if self.lock_win is None:
+            self.lock_win = LockScreen(self._root, message)
 
     def _hide_lock(self):
         if self.lock_win:
             self.lock_win.destroy()
             self.lock_win = None
 
+    def stop(self):
+        """Ask the agent to shut down; safe to call from any thread."""
+        self._stop_event.set()
+        if self._root is not None:
+            self._root.after(0, self._root.quit)
+
+    def _wake_tk(self):
+        """Cheap periodic tick: threaded Tcl only checks for Python signals
+        after an event arrives, so without it Ctrl+C on an idle agent is lost."""
+        self._root.after(500, self._wake_tk)
+
     def run(self):
-        print(f"🔐 Lock Agent running — polling {self.server}")
+        print(f"🔐 Lock Agent running — listening to {self.server}")
+        self._root = tk.Tk()
+        self._root.withdraw()
+
         poll_thread = threading.Thread(target=self.poll, daemon=True)
         poll_thread.start()
 
-        # Main thread just keeps alive
+        # Tk's own event loop drives the lock window; no manual update() pumping
         try:
-            while self._running:
-                if self.lock_win:
-                    try:
-                        self.lock_win.root.update()
-                    except tk.TclError:
-                        self.lock_win = None
-                time.sleep(0.05)
+            self._wake_tk()
+            self._root.mainloop()
         except KeyboardInterrupt:
             print("\n[Agent stopped]")
-            self._running = False
-            if self.lock_win:
-                self.lock_win.destroy()
+        finally:
+            self._stop_event.set()
+            self._hide_lock()
+            self._root.destroy()
 
 
 # ── System Tray (optional, requires pystray) ───────────────────────────────
@@ -250,7 +349,6 @@ def run_with_tray(agent: LockAgent):
     """Wrap agent in a system tray icon so it hides in background."""
     try:
         import pystray
-        from PIL import Image, ImageDraw
 
         # Simple red square icon
         img = Image.new("RGB", (64, 64), color="#cc2200")
@@ -258,7 +356,7 @@ def run_with_tray(agent: LockAgent):
         d.text((16, 18), "🔒", fill="white")
 
         def on_quit(icon, item):
-            agent._running = False
+            agent.stop()
             icon.stop()
 
         icon = pystray.Icon(
@@ -287,7 +385,7 @@ if __name__ == "__main__":
     parser.add_argument("--secret", default=DEFAULT_SECRET,
                         help="Shared secret for authentication")
     parser.add_argument("--tray", action="store_true",
-                        help="Run in system tray (requires pystray + pillow)")
+                        help="Run in system tray (requires pystray)")
     args = parser.parse_args()
 
     agent = LockAgent(server=args.server, secret=args.secret)
@@ -2,18 +2,44 @@
 Remote Lock Server — Deploy on Koyeb
 Handles lock/unlock state and serves the admin control panel.
 """
-from flask import Flask, jsonify, request, send_from_directory, abort
-import time, os, secrets
+from flask import Flask, Response, request, send_from_directory, abort, stream_with_context
+import time, os, re, secrets, hashlib, threading
+import orjson
 
 app = Flask(__name__, static_folder="static")
 
 # ── State ──────────────────────────────────────────────────────────────────
-lock_state = {
+# The current state is an immutable snapshot (state dict, encoded body, ETag).
+# Writers build a new dict and publish it with a single assignment; readers
+# grab _snapshot once and never take a lock or see a half-applied update.
+_snapshot: tuple[dict, bytes, str]
+
+# RLock-backed: serializes writers and wakes /api/events streams on publish
+_state_changed = threading.Condition()
+
+def _publish(state: dict):
+    global _snapshot
+    body = orjson.dumps(state)
+    etag = hashlib.blake2b(body, digest_size=8).hexdigest()   # unquoted entity tag
+    with _state_changed:
+        _snapshot = (state, body, etag)
+        _state_changed.notify_all()
+
+_publish({
     "locked": False,
     "message": "⚠️ System Error Detected\n\nPlease contact your System Administrator\nto resolve this issue.",
     "triggered_at": None,
     "triggered_by": None,
-}
+})
+
+HEARTBEAT_INTERVAL = 30   # seconds between SSE keepalive comments
+
+# Each /api/events stream holds one of gunicorn's --worker-connections (1000)
+# for as long as its agent is connected. Cap the streams below that so the
+# panel and write endpoints can always connect; agents turned away with 503
+# fall back to conditional polling of /api/status.
+MAX_EVENT_STREAMS = int(os.environ.get("MAX_EVENT_STREAMS", 900))
+_event_slots = threading.BoundedSemaphore(MAX_EVENT_STREAMS)
 
 # Simple shared secret — set via env var LOCK_SECRET on Koyeb
 ADMIN_SECRET = os.environ.get("LOCK_SECRET", "change-me-secret-123")
@@ -24,44 +50,126 @@ def require_auth():
     if token != ADMIN_SECRET:
         abort(403, "Forbidden: invalid secret")
 
+def ojsonify(obj):
+    """jsonify() replacement backed by orjson."""
+    return app.response_class(orjson.dumps(obj), mimetype="application/json")
+
+def read_json():
+    """Parse the request body with orjson; empty or malformed bodies give {}."""
+    if not request.data:
+        return {}
+    try:
+        data = orjson.loads(request.get_data())
+    except orjson.JSONDecodeError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+def update_state(**changes) -> dict:
+    """Publish a copy of the current state with *changes* applied."""
+    with _state_changed:
+        state = {**_snapshot[0], **changes}
+        _publish(state)
+    return state
+
 # ── API Routes ─────────────────────────────────────────────────────────────
 @app.route("/api/status", methods=["GET"])
 def status():
-    """Laptop agent polls this endpoint every 2 seconds."""
-    return jsonify(lock_state)
+    """Polled by the control panel; agents follow /api/events instead."""
+    _, body, etag = _snapshot
+    # Weak comparison, per RFC 9110 for If-None-Match: also matches W/"…",
+    # tag lists and "*"
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    return response
+
+@app.route("/api/events", methods=["GET"])
+def events():
+    """Server-sent events: pushes the status payload whenever it changes.
+
+    Each event carries the status ETag as its id. A reconnecting agent that
+    sends it back as Last-Event-ID already has the current state, so the
+    initial snapshot is skipped until something changes.
+    """
+    if not _event_slots.acquire(blocking=False):
+        return app.response_class(b"Too many event streams", status=503,
+                                  headers={"Retry-After": str(HEARTBEAT_INTERVAL)})
+    last_id = request.headers.get("Last-Event-ID")
+
+    def gen():
+        # Servers send the status line and headers with the first chunk, so
+        # emit one straight away; a resuming agent would otherwise wait a
+        # whole heartbeat before it sees the response
+        yield ": ok\n\n"
+        snap = _snapshot
+        seen = snap if last_id == snap[2] else None
+        while True:
+            with _state_changed:
+                if _snapshot is seen:
+                    _state_changed.wait(timeout=HEARTBEAT_INTERVAL)
+                snap = _snapshot
+            if snap is seen:
+                yield ": keepalive\n\n"
+            else:
+                seen = snap
+                _, body, etag = snap
+                yield f"id: {etag}\ndata: {body.decode()}\n\n"
+
+    response = Response(stream_with_context(gen()), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.call_on_close(_event_slots.release)
+    return response
 
 @app.route("/api/lock", methods=["POST"])
 def lock():
     require_auth()
-    data = request.get_json(silent=True) or {}
-    lock_state["locked"] = True
-    lock_state["message"] = data.get("message", lock_state["message"])
-    lock_state["triggered_at"] = time.time()
-    lock_state["triggered_by"] = request.remote_addr
-    return jsonify({"ok": True, "state": lock_state})
+    data = read_json()
+    changes = {"message": data["message"]} if "message" in data else {}
+    state = update_state(locked=True, triggered_at=time.time(),
+                         triggered_by=request.remote_addr, **changes)
+    return ojsonify({"ok": True, "state": state})
 
 @app.route("/api/unlock", methods=["POST"])
 def unlock():
     require_auth()
-    lock_state["locked"] = False
-    lock_state["triggered_at"] = time.time()
-    return jsonify({"ok": True, "state": lock_state})
+    state = update_state(locked=False, triggered_at=time.time())
+    return ojsonify({"ok": True, "state": state})
 
 @app.route("/api/message", methods=["POST"])
 def update_message():
     """Update lock screen message without changing lock state."""
     require_auth()
-    data = request.get_json(silent=True) or {}
-    lock_state["message"] = data.get("message", lock_state["message"])
-    return jsonify({"ok": True, "state": lock_state})
+    data = read_json()
+    changes = {"message": data["message"]} if "message" in data else {}
+    state = update_state(**changes)
+    return ojsonify({"ok": True, "state": state})
 
 # ── Serve Frontend ─────────────────────────────────────────────────────────
+# Static files are fixed for the life of the process, so index them once
+# instead of stat()ing the user-supplied path on every request.
+STATIC_PATHS = {
+    os.path.relpath(os.path.join(root, f), app.static_folder).replace(os.sep, "/")
+    for root, _, files in os.walk(app.static_folder) for f in files
+}
+
+# Assets named like main.3f2a9c1d.js carry a content hash, so the browser and
+# any edge cache may keep them forever; everything else (index.html) must be
+# revalidated so a deploy shows up immediately.
+FINGERPRINTED = re.compile(r"\.[0-9a-f]{8,}\.[A-Za-z0-9]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
 @app.route("/", defaults={"path": ""})
 @app.route("/<path:path>")
 def serve(path):
-    if path and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
-    return send_from_directory(app.static_folder, "index.html")
+    if app.debug and path and os.path.isfile(os.path.join(app.static_folder, path)):
+        STATIC_PATHS.add(path)             # pick up files added while developing
+    if path not in STATIC_PATHS:
+        path = "index.html"
+    response = send_from_directory(app.static_folder, path)
+    response.headers["Cache-Control"] = IMMUTABLE if FINGERPRINTED.search(path) else "no-cache"
+    return response
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))